@@ -2,9 +2,13 @@ import globalPluginHandler
 from speech.extensions import pre_speechQueued  # Import the event
 from logHandler import log
 import asyncio
+import collections
+import socket
+import struct
 import threading
 import sys
 import os
+import zlib
 
 # Add the lib directory to the path so we can import the websockets module
 addon_dir = os.path.dirname(os.path.dirname(__file__))
@@ -13,7 +17,36 @@ sys.path.append(lib_path)
 
 import websockets
 
+# Each length-prefixed entry in a batch frame is a 2-byte big-endian length
+# followed by that many bytes of UTF-8 text.
+_ENTRY_LEN = struct.Struct(">H")
+_ENTRY_MAX = 0xFFFF
+
+
 class WebSocketServer:
+    """Broadcasts speech text to WebSocket clients as binary batch frames.
+
+    Wire format: one prefix byte (0x00 = raw body, 0x01 = zlib-compressed
+    body), then a body of length-prefixed entries, each a 2-byte big-endian
+    length followed by UTF-8 text. No JSON on the hot path.
+    """
+
+    __slots__ = (
+        'host', 'port', 'clients', 'server', 'loop', 'thread', 'running',
+        '_outbound', '_wake', '_wake_pending', '_drain_task',
+        '_client_snapshot', '_clients_dirty',
+    )
+
+    # Coalescing window for outbound messages: buffer for up to this long,
+    # then send batch frames of at most FLUSH_MAX_ITEMS messages each.
+    FLUSH_INTERVAL = 0.02
+    FLUSH_MAX_ITEMS = 64
+    # Bodies larger than this are deflated once before broadcast.
+    COMPRESS_MIN_BYTES = 256
+    # A client whose transport write buffer exceeds this is not draining its
+    # socket; drop it before it accumulates the whole speech stream in memory.
+    WRITE_BUFFER_LIMIT = 1 << 20
+
     def __init__(self, host='127.0.0.1', port=8765):
         self.host = host
         self.port = port
@@ -22,50 +55,156 @@ class WebSocketServer:
         self.loop = None
         self.thread = None
         self.running = False
+        # Outbound ring: deque appends/pops are thread-safe, so the NVDA
+        # thread pushes here without a lock and the drain coroutine empties
+        # it in one pass per wakeup.
+        self._outbound = collections.deque()
+        self._wake = asyncio.Event()
+        self._wake_pending = False
+        self._drain_task = None
+        # Immutable client snapshot, rebuilt lazily in broadcast() when the
+        # dirty flag says membership changed. All mutation happens on the
+        # loop thread, so no lock is needed; tuple reads are atomic under
+        # the GIL for any cross-thread observer.
+        self._client_snapshot = ()
+        self._clients_dirty = False
 
     async def ws_handler(self, websocket):
         """Handle client connections"""
+        # Batched flushes already give us one write per window; make sure
+        # Nagle's algorithm doesn't sit on that write. (TCP_CORK-style
+        # corking isn't available on Windows, and isn't needed since each
+        # flush is a single transport.write anyway.)
+        try:
+            sock = websocket.transport.get_extra_info('socket')
+            if sock is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            pass
         self.clients.add(websocket)
+        self._clients_dirty = True
         try:
             log.info(f"NVDA Text Bridge: WebSocket client connected: {websocket.remote_address}")
             # Keep connection alive until client disconnects
             await websocket.wait_closed()
         finally:
             self.clients.remove(websocket)
+            self._clients_dirty = True
             log.info(f"NVDA Text Bridge: WebSocket client disconnected: {websocket.remote_address}")
 
-    async def broadcast(self, message):
-        """Send message to all connected clients"""
-        if not self.clients:
+    def broadcast(self, payload):
+        """Send an already-encoded ``bytes`` payload to all connected clients.
+
+        Encoding happens once in the caller and ``websockets.broadcast``
+        pushes the same bytes straight to every transport: no per-client
+        tasks, no gather, and connections that aren't open are skipped by
+        the library. The snapshot is only rebuilt when membership changed,
+        so steady-state broadcasts allocate nothing per message.
+        """
+        if self._clients_dirty:
+            self._client_snapshot = tuple(self.clients)
+            self._clients_dirty = False
+        snapshot = self._client_snapshot
+        # websockets.broadcast applies no backpressure, so shed clients whose
+        # write buffer shows they stopped draining their socket. abort() frees
+        # the buffered data immediately; close() would wait for it to flush,
+        # which is exactly what a stalled peer never does.
+        limit = self.WRITE_BUFFER_LIMIT
+        for client in snapshot:
+            transport = client.transport
+            if (
+                transport is not None
+                and transport.get_write_buffer_size() > limit
+            ):
+                log.warning(f"NVDA Text Bridge: Dropping slow client {client.remote_address}")
+                transport.abort()
+        websockets.broadcast(snapshot, payload)
+
+    def send_message(self, messages):
+        """Queue a sequence of text messages from outside the event loop.
+
+        Messages go into a lock-free ring and are flushed as batch frames
+        after a short window. The loop is woken at most once per batch: the
+        first message after a flush pays for one call_soon_threadsafe, the
+        rest just append.
+        """
+        if not (self.loop and self.running):
             return
-            
-        # Create tasks for sending to each client
-        tasks = [client.send(message) for client in self.clients.copy()]
-        if tasks:
-            # Run all tasks concurrently and gather results
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            # Check for exceptions
-            for client, result in zip(self.clients.copy(), results):
-                if isinstance(result, Exception):
-                    log.error(f"NVDA Text Bridge: Error sending to client {client.remote_address}: {result}")
-                    # Client might be disconnected, try to remove it
-                    try:
-                        self.clients.remove(client)
-                        await client.close()
-                    except:
-                        pass
-
-    def send_message(self, message):
-        """Send message from outside the event loop"""
-        if self.loop and self.running:
-            asyncio.run_coroutine_threadsafe(self.broadcast(message), self.loop)
+        self._outbound.extend(messages)
+        if not self._wake_pending:
+            self._wake_pending = True
+            self.loop.call_soon_threadsafe(self._wake.set)
+
+    async def _drain(self):
+        """Single long-lived coroutine turning the outbound ring into batch frames"""
+        # Bind the per-iteration lookups once: LOAD_FAST beats LOAD_ATTR in
+        # a loop that runs for the life of the server.
+        wake = self._wake
+        interval = self.FLUSH_INTERVAL
+        sleep = asyncio.sleep
+        flush = self._flush
+        while True:
+            await wake.wait()
+            # Let the burst accumulate before draining (coalescing window).
+            await sleep(interval)
+            wake.clear()
+            self._wake_pending = False
+            flush()
+
+    def _flush(self):
+        """Drain the outbound ring and broadcast it as batch frames (loop thread only)"""
+        outbound = self._outbound
+        if not outbound:
+            return
+        pending = []
+        while outbound:
+            pending.append(outbound.popleft())
+        pack_len = _ENTRY_LEN.pack
+        for start in range(0, len(pending), self.FLUSH_MAX_ITEMS):
+            items = pending[start:start + self.FLUSH_MAX_ITEMS]
+            # Frame once here; broadcast reuses the same bytes object for
+            # every client. Length-prefixed UTF-8 entries, no JSON.
+            buf = bytearray()
+            for text in items:
+                data = text.encode()
+                # Oversize entries (rare; say-all of a huge paragraph) are
+                # split across several length-prefixed entries, backing each
+                # cut off past UTF-8 continuation bytes so every entry stays
+                # independently decodable.
+                off = 0
+                size = len(data)
+                while off < size:
+                    end = off + _ENTRY_MAX
+                    if end < size:
+                        while data[end] & 0xC0 == 0x80:
+                            end -= 1
+                    else:
+                        end = size
+                    entry = data[off:end]
+                    buf += pack_len(len(entry))
+                    buf += entry
+                    off = end
+            if not buf:
+                continue
+            body = bytes(buf)
+            # Compress once for all clients instead of letting per-message-deflate
+            # redo the same work per client.
+            if len(body) > self.COMPRESS_MIN_BYTES:
+                payload = b"\x01" + zlib.compress(body, 1)
+            else:
+                payload = b"\x00" + body
+            self.broadcast(payload)
 
     async def start_server(self):
         """Start the WebSocket server"""
         self.server = await websockets.serve(
-            self.ws_handler, self.host, self.port
+            self.ws_handler, self.host, self.port,
+            # Per-message-deflate would compress the same broadcast once per
+            # client; we deflate once in _flush instead.
+            compression=None,
         )
         log.info(f"NVDA Text Bridge: WebSocket server started on {self.host}:{self.port}")
+        self._drain_task = asyncio.create_task(self._drain())
         self.running = True
         # Keep the server running
         await self.server.wait_closed()
@@ -92,6 +231,8 @@ class WebSocketServer:
         """Stop the WebSocket server"""
         if self.server and self.loop and self.running:
             async def shutdown():
+                if self._drain_task is not None:
+                    self._drain_task.cancel()
                 if self.server is not None:
                     self.server.close()
                     await self.server.wait_closed()
@@ -107,6 +248,14 @@ class WebSocketServer:
         if self.thread and self.thread.is_alive():
             self.thread.join(timeout=1)
 
+# Speech sequence items we can turn into text, keyed on exact type so the
+# per-item cost is one dict lookup instead of a chain of isinstance checks.
+# Types without a handler (pitch changes, beeps, etc.) are dropped.
+_SEQUENCE_ITEM_HANDLERS = {
+	str: lambda item: item,
+}
+
+
 class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 	"""
 	NVDA Text Bridge Global Plugin
@@ -119,7 +268,17 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 		super().__init__()
 		
 		self._captureEnabled = True
-		
+
+		# One-entry memo for the last multi-item sequence: NVDA re-speaks
+		# identical sequences back to back (focus changes, repeat-key reads),
+		# so keying on item identity lets repeats skip the filtering pass.
+		# _lastSeqItems keeps the compared items alive: without the strong
+		# reference, CPython recycles freed ids and the id tuple would match
+		# for different content.
+		self._lastSeqIds = None
+		self._lastSeqItems = None
+		self._lastParts = None
+
 		# Initialize WebSocket server
 		self.ws_server = WebSocketServer()
 		self.ws_server.start()
@@ -134,12 +293,33 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 		Captures speech before it is queued and sends it to WebSocket clients.
 		"""
 
-		for chunk in speechSequence:
-			if not isinstance(chunk, str):  # Not text (maybe a pitch change, beep, etc.). Not useful for us.
-				continue
-			log.info(f"NVDA Text Bridge: Raw speech sequence: {chunk}")
-			# Send the speech text to WebSocket clients
-			self.ws_server.send_message(chunk)
+		# Fast path: most utterances are a single plain string, so skip the
+		# list build and filtering entirely. type() is str avoids the MRO
+		# walk isinstance would do per item.
+		if len(speechSequence) == 1 and type(speechSequence[0]) is str:
+			parts = speechSequence
+		else:
+			seqIds = tuple(map(id, speechSequence))
+			if seqIds == self._lastSeqIds:
+				parts = self._lastParts
+			else:
+				# Collect all text chunks so the whole sequence goes out as one
+				# WebSocket frame instead of one frame (and one socket write) per chunk.
+				handlers = _SEQUENCE_ITEM_HANDLERS
+				parts = []
+				for chunk in speechSequence:
+					handler = handlers.get(type(chunk))
+					if handler is not None:
+						parts.append(handler(chunk))
+				self._lastSeqIds = seqIds
+				self._lastSeqItems = tuple(speechSequence)
+				self._lastParts = parts
+			if not parts:
+				return
+		log.info(f"NVDA Text Bridge: Raw speech sequence: {parts}")
+		# Queue the speech text for WebSocket clients; the server frames
+		# the whole batch window as one length-prefixed binary message.
+		self.ws_server.send_message(parts)
 	
 	def terminate(self):
 		"""Clean up when the plugin is terminated"""